@@ -8,7 +8,73 @@
 
 import math
 import random
+import weakref
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import game
+import othello_bb
+import search_nb
+import transposition
+from othello_bb import CORNER_BONUS, ANTICORNER_PENALTY, NULL_MOVE_MIN_DEPTH, NULL_MOVE_REDUCTION, NULL_MOVE_MIN_EMPTIES
+
+NEG_INF = -math.inf
+POS_INF = math.inf
+
+## Minimum search depth for which the root moves are handed to worker processes, for searches run in Python. Each root
+#  move then takes several milliseconds, against about 0.2 ms to send it to a worker and get its value back.
+PARALLEL_MIN_DEPTH = 4
+
+## The same for AlphaBeta, which hands subtrees of KERNEL_DEPTH plies or less to the compiled kernel; those take well
+#  under a millisecond each. Two plies above the kernel a root move takes about as long as a Python search of
+#  PARALLEL_MIN_DEPTH plies.
+ALPHABETA_PARALLEL_MIN_DEPTH = search_nb.KERNEL_DEPTH + 2 if search_nb.KERNEL_DEPTH else PARALLEL_MIN_DEPTH
+
+## Depth of the serial pass AlphaBeta uses to order the root moves before searching them in full.
+SHALLOW_DEPTH = 2
+
+
+## Search the subtree below one root move; the entry point of the worker processes.
+#  @param agent A copy of the agent doing the search (see RootPool.__getstate__).
+#  @param own The discs of the player to move after the root move.
+#  @param opp The discs of the opponent after the root move.
+#  @param alpha The alpha value for pruning, from the root player's point of view.
+#  @param beta The beta value for pruning, from the root player's point of view.
+#  @return The value of the root move for the root player.
+def _search_child(agent, own, opp, alpha, beta):
+    return agent._child_value(own, opp, alpha, beta)
+
+
+## RootPool class
+#  Mixin giving a search agent a pool of worker processes for its root moves. The pool is created on first use and
+#  reused for every later move, since starting processes costs more than a shallow search. It is shut down by close(),
+#  or when the agent is garbage collected.
+class RootPool:
+
+    ## Get the agent's worker pool, creating it if needed.
+    #  @return A ProcessPoolExecutor with self.workers processes.
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._finalizer = weakref.finalize(self, self._executor.shutdown, wait=True)
+        return self._executor
+
+    ## Shut down the worker processes, if any were started; a later parallel search starts a new pool.
+    def close(self):
+        if self._executor is not None:
+            self._finalizer()
+            self._executor = None
+
+    ## Only the search settings are sent to the workers; each worker starts with an empty table and no pool.
+    #  @return The state to pickle.
+    def __getstate__(self):
+        return {'color': self.color, 'depth': self.depth}
+
+    ## Restore an agent sent to a worker process.
+    #  @param state The state returned by __getstate__.
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.tt = {}
+        self.workers = 1
+        self._executor = None
 
 
 ## HumanPlayer class
@@ -50,120 +116,319 @@ class RandomAgent(game.Player):
 
 ## MinimaxAgent class
 #  Inherits from game.Player and represents an AI player that uses the Minimax algorithm.
-class MinimaxAgent(game.Player):
+class MinimaxAgent(RootPool, game.Player):
     
     ## The constructor for the MinimaxAgent class.
     #  @param depth The maximum depth to search in the game tree.
     #  @param color The color ('O' or 'X') representing the AI player.
-    def __init__(self, depth, color):
+    #  @param workers The number of processes to search root moves with (by default 1, which searches them here).
+    def __init__(self, depth, color, workers=1):
         self.color = color
         self.depth = depth
+        self.tt = {}
+        self.workers = workers
+        self._executor = None
 
-    ## Method to evaluate the current board state.
-    #  @param state The current state of the Othello game.
-    #  @return The score of the board state from the perspective of the AI player's color.
-    def evaluate_board(self, state):
-        score = state.score()
-        return score if self.color == 'O' else -score
+    ## Method to evaluate a board position.
+    #  @param own The discs of the player to move.
+    #  @param opp The discs of the opponent.
+    #  @return The score of the position from the perspective of the player to move.
+    def evaluate_board(self, own, opp):
+        return othello_bb.evaluate(own, opp)
     
-    ## Minimax search algorithm.
-    #  @param state The current state of the Othello game.
+    ## Minimax search algorithm, in negamax form: every node maximizes the negated values of its children.
+    #  @param own The discs of the player to move.
+    #  @param opp The discs of the opponent.
     #  @param depth The current depth in the search tree.
-    #  @param maximizing_player A boolean indicating if the current player is maximizing or minimizing.
-    #  @return The best score found for the current move and depth.
-    def minimax(self, state, depth, maximizing_player):
-        if depth == 0 or state.game_over():
-            return self.evaluate_board(state)
-
-        if maximizing_player:
-            max_eval = float('-inf')
-            for move in state.generateMoves():
-                new_state = state.applyMoveCloning(move)
-                evaluation = self.minimax(new_state, depth - 1, False)
-                max_eval = max(max_eval, evaluation)
-            return max_eval
+    #  @return The best score found for the player to move at the current depth.
+    def minimax(self, own, opp, depth):
+        if depth == 0:
+            return self.evaluate_board(own, opp)
+        key = (own, opp)
+        entry = self.tt.get(key)
+        if entry is not None and entry.depth >= depth:
+            return entry.value
+
+        moves = othello_bb.legal_moves(own, opp)
+        best_move = None
+        if not moves:
+            if othello_bb.legal_moves(opp, own):
+                # The player to move has to pass:
+                value = -self.minimax(opp, own, depth)
+            else:
+                value = self.evaluate_board(own, opp)
         else:
-            min_eval = float('inf')
-            for move in state.generateMoves():
-                new_state = state.applyMoveCloning(move)
-                evaluation = self.minimax(new_state, depth - 1, True)
-                min_eval = min(min_eval, evaluation)
-            return min_eval
+            value = NEG_INF
+            apply = othello_bb.apply
+            while moves:
+                move = moves & -moves
+                moves ^= move
+                new_own, new_opp = apply(own, opp, move)
+                evaluation = -self.minimax(new_opp, new_own, depth - 1)
+                if evaluation > value:
+                    value = evaluation
+                    best_move = move.bit_length() - 1
+        # Minimax searches every child, so the value is always exact:
+        self.tt[key] = transposition.TTEntry(depth, transposition.EXACT, value, best_move)
+        return value
     
+    ## First phase of the batched minimax: expand the tree down to the positions one ply above the leaves and collect
+    #  them into a frontier, stored as one list of own discs and one list of opponent discs.
+    #  @param own The discs of the player to move.
+    #  @param opp The discs of the opponent.
+    #  @param depth The current depth in the search tree (at least 1).
+    #  @param owns The own discs of the frontier positions collected so far.
+    #  @param opps The opponent discs of the frontier positions collected so far.
+    #  @param seen The nodes already expanded, by (own, opp), so that transpositions are expanded once.
+    #  @return The node: an index into the frontier, or a list of the child nodes.
+    def _expand(self, own, opp, depth, owns, opps, seen):
+        key = (own, opp)
+        node = seen.get(key)
+        if node is not None:
+            return node
+        moves = othello_bb.legal_moves(own, opp)
+        if (depth == 1 and moves) or not (moves or othello_bb.legal_moves(opp, own)):
+            # Frontier positions with moves are searched one ply deep in the batch, the ones without are game over:
+            node = len(owns)
+            owns.append(own)
+            opps.append(opp)
+        elif not moves:
+            # The player to move has to pass:
+            node = [self._expand(opp, own, depth, owns, opps, seen)]
+        else:
+            node = []
+            apply = othello_bb.apply
+            while moves:
+                move = moves & -moves
+                moves ^= move
+                new_own, new_opp = apply(own, opp, move)
+                node.append(self._expand(new_opp, new_own, depth - 1, owns, opps, seen))
+        seen[key] = node
+        return node
+
+    ## Second phase of the batched minimax: compute the value of a node from the values of the frontier.
+    #  @param node A node returned by _expand.
+    #  @param values The value of each frontier position, from othello_bb.frontier_values.
+    #  @param memo The values of the nodes already computed, by id, for nodes shared between transpositions.
+    #  @return The value of the node for the player to move.
+    def _backfill(self, node, values, memo):
+        if isinstance(node, int):
+            return values[node]
+        value = memo.get(id(node))
+        if value is None:
+            value = max(-self._backfill(child, values, memo) for child in node)
+            memo[id(node)] = value
+        return value
+
+    ## Minimax search done in two phases: the upper part of the tree is expanded move by move, then the last ply,
+    #  which holds most of the nodes, is played and evaluated for the whole frontier at once with NumPy. This gives
+    #  the same value as minimax, as long as evaluate_board is the disc differential.
+    #  @param own The discs of the player to move.
+    #  @param opp The discs of the opponent.
+    #  @param depth The current depth in the search tree (at least 1).
+    #  @return The best score found for the player to move at the current depth.
+    def minimax_batched(self, own, opp, depth):
+        owns, opps = [], []
+        root = self._expand(own, opp, depth, owns, opps, {})
+        return self._backfill(root, othello_bb.frontier_values(owns, opps), {})
+
+    ## Value of a root move for the AI player.
+    #  @param own The discs of the player to move after the root move.
+    #  @param opp The discs of the opponent after the root move.
+    #  @param alpha Unused; minimax searches every move with the full window.
+    #  @param beta Unused; minimax searches every move with the full window.
+    #  @return The minimax value of the root move.
+    def _child_value(self, own, opp, alpha, beta):
+        if othello_bb.BATCH and self.depth > 0:
+            return -self.minimax_batched(own, opp, self.depth)
+        return -self.minimax(own, opp, self.depth)
+
     ## Method to choose the best move based on the Minimax algorithm.
     #  @param state The current state of the Othello game.
     #  @return The best move found by the Minimax algorithm.
     def choose_move(self, state):
+        # Every move adds a disc, so positions from earlier turns can never recur; start each turn with an empty table.
+        self.tt = {}
+        own, opp = othello_bb.from_state(state)
+        children = []
+        for square in othello_bb.squares(othello_bb.legal_moves(own, opp)):
+            new_own, new_opp = othello_bb.apply(own, opp, 1 << square)
+            children.append((square, new_opp, new_own))
+
+        if self.workers > 1 and self.depth >= PARALLEL_MIN_DEPTH and len(children) > 1:
+            pool = self._pool()
+            futures = [pool.submit(_search_child, self, child_own, child_opp, None, None)
+                       for _, child_own, child_opp in children]
+            values = [future.result() for future in futures]
+        else:
+            values = [self._child_value(child_own, child_opp, None, None) for _, child_own, child_opp in children]
+
         best_move = None
-        best_value = float('-inf')
-        for move in state.generateMoves():
-            new_state = state.applyMoveCloning(move)
-            move_evaluation = self.minimax(new_state, self.depth, False)
+        best_value = NEG_INF
+        for (square, _, _), move_evaluation in zip(children, values):
             if move_evaluation > best_value:
                 best_value = move_evaluation
-                best_move = move
-        return best_move
+                best_move = square
+        return othello_bb.to_move(state, best_move)
 
 ## AlphaBeta class
 #  Inherits from game.Player and represents an AI player that uses the Alpha-Beta pruning algorithm.
-class AlphaBeta(game.Player):
+class AlphaBeta(RootPool, game.Player):
     
     ## The constructor for the AlphaBeta class.
     #  @param color The color ('O' or 'X') representing the AI player.
     #  @param depth The maximum depth to search in the game tree.
-    def __init__(self, color, depth):
+    #  @param workers The number of processes to search root moves with (by default 1, which searches them here).
+    #  @param null_move_pruning Whether to try null moves (see _negamax); off by default, since a null-move cutoff can
+    #         make the agent miss the best move of a fixed-depth search.
+    def __init__(self, color, depth, workers=1, null_move_pruning=False):
         self.color = color
         self.depth = depth
+        self.tt = {}
+        self.workers = workers
+        self.null_move_pruning = null_move_pruning
+        self._executor = None
+
+    ## The workers also need to know whether to try null moves.
+    #  @return The state to pickle.
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['null_move_pruning'] = self.null_move_pruning
+        return state
         
-    ## Method to evaluate the current board state.
-    #  @param state The current state of the Othello game.
-    #  @return The score of the board state from the perspective of the AI player's color.
-    def evaluate_board(self, state):
-        score = state.score()
-        return score if self.color == 'O' else -score
+    ## Method to evaluate a board position.
+    #  @param own The discs of the player to move.
+    #  @param opp The discs of the opponent.
+    #  @return The score of the position from the perspective of the player to move.
+    def evaluate_board(self, own, opp):
+        return othello_bb.evaluate(own, opp)
 
-    ## Alpha-Beta pruning search algorithm.
-    #  @param state The current state of the Othello game.
+    ## Order moves so the ones most likely to cause a cutoff are searched first.
+    #  @param moves A bitboard of the moves to order.
+    #  @param tt_move The square index of the best move stored in the transposition table, or None.
+    #  @return A list of square indices with the transposition table move first, then corners, with anti-corners last.
+    def _order(self, moves, tt_move):
+        def key(square):
+            return (square != tt_move, -CORNER_BONUS.get(square, 0), ANTICORNER_PENALTY.get(square, 0))
+        return sorted(othello_bb.squares(moves), key=key)
+
+    ## Alpha-Beta pruning search in negamax form, with principal variation search: the first (best ordered) move
+    #  is searched with the full window and the remaining moves with a null window, re-searching only on a fail-high.
+    #  With null_move_pruning, a null move (letting the opponent move twice) is searched at reduced depth before the
+    #  moves; if the position still scores beta or more, the node is cut off without searching any real move.
+    #  @param own The discs of the player to move.
+    #  @param opp The discs of the opponent.
     #  @param depth The current depth in the search tree.
     #  @param alpha The alpha value for pruning.
     #  @param beta The beta value for pruning.
-    #  @param maximizing_player A boolean indicating if the current player is maximizing or minimizing.
-    #  @return The best value found using Alpha-Beta pruning and the corresponding move.
-    def alpha_beta_search(self, state, depth, alpha, beta, maximizing_player):
-        if depth == 0 or state.game_over():
-            return self.evaluate_board(state)
-
-        if maximizing_player:
-            value = float('-inf')
-            for move in state.generateMoves():
-                new_state = state.applyMoveCloning(move)
-                value = max(value, self.alpha_beta_search(new_state, depth - 1, alpha, beta, False))
-                alpha = max(alpha, value)
-                if alpha >= beta:
-                    break
-            return value
-        else:
-            value = float('inf')
-            for move in state.generateMoves():
-                new_state = state.applyMoveCloning(move)
-                value = min(value, self.alpha_beta_search(new_state, depth - 1, alpha, beta, True))
-                beta = min(beta, value)
-                if beta <= alpha:
-                    break
+    #  @param null_move Whether a null move may be tried (not right after another null move).
+    #  @return The best value found for the player to move using Alpha-Beta pruning.
+    def _negamax(self, own, opp, depth, alpha, beta, null_move=True):
+        if 64 - othello_bb.popcount(own | opp) <= search_nb.END_THRESHOLD:
+            # Close to the end, searching to the last move is about as cheap and gives the exact result:
+            return search_nb.solve_endgame(own, opp, alpha, beta)
+        if depth == 0:
+            return self.evaluate_board(own, opp)
+        if depth <= search_nb.KERNEL_DEPTH:
+            return search_nb.search(own, opp, depth, alpha, beta)
+        key = (own, opp)
+        value, alpha, beta, tt_move = transposition.probe(self.tt, key, depth, alpha, beta)
+        if value is not None:
             return value
+
+        moves = othello_bb.legal_moves(own, opp)
+        if not moves:
+            if othello_bb.legal_moves(opp, own):
+                # The player to move has to pass:
+                return -self._negamax(opp, own, depth, -beta, -alpha)
+            return self.evaluate_board(own, opp)
+
+        if (null_move and self.null_move_pruning and depth >= NULL_MOVE_MIN_DEPTH and beta < POS_INF
+                and 64 - othello_bb.popcount(own | opp) > NULL_MOVE_MIN_EMPTIES):
+            null_value = -self._negamax(opp, own, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + 1, False)
+            if null_value >= beta:
+                return beta
+
+        alpha_orig = alpha
+        value = NEG_INF
+        best_move = None
+        apply = othello_bb.apply
+        for i, square in enumerate(self._order(moves, tt_move)):
+            new_own, new_opp = apply(own, opp, 1 << square)
+            if i == 0:
+                child_value = -self._negamax(new_opp, new_own, depth - 1, -beta, -alpha)
+            else:
+                child_value = -self._negamax(new_opp, new_own, depth - 1, -alpha - 1, -alpha)
+                if alpha < child_value < beta:
+                    child_value = -self._negamax(new_opp, new_own, depth - 1, -beta, -alpha)
+            if child_value > value:
+                value = child_value
+                best_move = square
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+        transposition.store(self.tt, key, depth, value, alpha_orig, beta, best_move)
+        return value
+        
+    ## Value of a root move for the AI player.
+    #  @param own The discs of the player to move after the root move.
+    #  @param opp The discs of the opponent after the root move.
+    #  @param alpha The alpha value for pruning, from the AI player's point of view.
+    #  @param beta The beta value for pruning, from the AI player's point of view.
+    #  @return The value of the root move (a bound if it falls outside the window).
+    def _child_value(self, own, opp, alpha, beta):
+        return -self._negamax(own, opp, self.depth, -beta, -alpha)
+
+    ## Search the root moves in parallel. The first (best ordered) move is searched here with the full window; the
+    #  others only need to be compared against it, which the workers do with a null window. The few moves that turn
+    #  out better are searched again with an open window.
+    #  @param children A list of (square, own, opp) tuples, one per root move, best first.
+    #  @return The square of the best move.
+    def _choose_parallel(self, children):
+        best_move, child_own, child_opp = children[0]
+        best_value = self._child_value(child_own, child_opp, NEG_INF, POS_INF)
+        pool = self._pool()
+        futures = {pool.submit(_search_child, self, child_own, child_opp, best_value, best_value + 1): square
+                   for square, child_own, child_opp in children[1:]}
+        better = set(futures[future] for future in as_completed(futures) if future.result() > best_value)
+        for square, child_own, child_opp in children[1:]:
+            if square in better:
+                value = self._child_value(child_own, child_opp, best_value, POS_INF)
+                if value > best_value:
+                    best_value = value
+                    best_move = square
+        return best_move
         
     ## Method to choose the best move based on the Alpha-Beta pruning algorithm.
     #  @param state The current state of the Othello game.
     #  @return The best move found by the Alpha-Beta pruning algorithm.
     def choose_move(self, state):
+        self.tt = {}
+        own, opp = othello_bb.from_state(state)
+        children = []
+        for square in self._order(othello_bb.legal_moves(own, opp), None):
+            new_own, new_opp = othello_bb.apply(own, opp, 1 << square)
+            children.append((square, new_opp, new_own))
+        if not children:
+            return None
+
+        if self.depth > SHALLOW_DEPTH and len(children) > 1:
+            # A shallow search of every move is cheap and orders the root moves much better than static scores:
+            shallow = {square: -self._negamax(child_own, child_opp, SHALLOW_DEPTH, NEG_INF, POS_INF)
+                       for square, child_own, child_opp in children}
+            children.sort(key=lambda child: -shallow[child[0]])
+
+        if self.workers > 1 and self.depth >= ALPHABETA_PARALLEL_MIN_DEPTH and len(children) > 1:
+            return othello_bb.to_move(state, self._choose_parallel(children))
+
         best_move = None
-        best_value = float('-inf')
-        alpha = float('-inf')
-        beta = float('inf')
-        for move in state.generateMoves():
-            new_state = state.applyMoveCloning(move)
-            move_value = self.alpha_beta_search(new_state, self.depth, alpha, beta, True)
+        best_value = NEG_INF
+        alpha = NEG_INF
+        beta = POS_INF
+        for square, child_own, child_opp in children:
+            move_value = self._child_value(child_own, child_opp, alpha, beta)
             if move_value > best_value:
                 best_value = move_value
-                best_move = move
-        return best_move
+                best_move = square
+            alpha = max(alpha, best_value)
+        return othello_bb.to_move(state, best_move)
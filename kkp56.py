@@ -4,86 +4,339 @@
 #          It features a class that enables the agent to make strategic moves within a specified time constraint, using iterative deepening and alpha-beta pruning techniques.
 #          The focus is on maximizing the search depth within the given time limit to enhance the agent's performance in competitive scenarios.
 
+import math
+import random
 import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, wait
 import game
-import othello
+import othello_bb
+import search_nb
+import transposition
+from othello_bb import CORNER_BONUS, ANTICORNER_PENALTY, NULL_MOVE_MIN_DEPTH, NULL_MOVE_REDUCTION, NULL_MOVE_MIN_EMPTIES
+
+NEG_INF = -math.inf
+POS_INF = math.inf
+
+## Number of search nodes between two reads of the clock. With the compiled kernel every node of the
+# Python search stands for a whole kernel subtree, so the clock is read at every node.
+NODES_PER_CHECK = 1 if search_nb.KERNEL_DEPTH else 1024
+
+## Half-width, in discs, of the aspiration window centred on the value found two iterations earlier.
+ASPIRATION_WINDOW = 2
+
+## Number of plies a search can be away from its root, which sizes the killer move table. The depth is at most 60 (the
+# number of empty squares), every real move or null move uses up at least one ply of it, and at most one pass can
+# follow each of them.
+MAX_PLY = 2 * 60
+
+## Seconds the main process waits, once its own search ends, for helper results that are not in yet.
+HELPER_GRACE = 0.005
+
+## Shared tables this (helper) process is attached to, by name, so that each helper attaches only once.
+_tables = {}
+
+## The agent this (helper) process searches with, created on its first search and reused for every later one.
+_helper = None
+
+
+## Search a position in a helper process until the deadline; the entry point of the helper processes.
+# @param own The discs of the player to move.
+# @param opp The discs of the opponent.
+# @param deadline The time.monotonic() value at which to stop.
+# @param table_name The name of the shared transposition table.
+# @param seed The seed of the helper's random move order.
+# @param null_move_pruning Whether to try null moves, as the main search does.
+# @return A tuple of the deepest completed depth and its best move (see kkp56._iterative_deepening).
+def _helper_search(own, opp, deadline, table_name, seed, null_move_pruning):
+    global _helper
+    table = _tables.get(table_name)
+    if table is None:
+        table = _tables[table_name] = transposition.SharedTable(table_name)
+    if _helper is None:
+        _helper = kkp56(None, 0)
+    _helper.tt = table
+    _helper.null_move_pruning = null_move_pruning
+    _helper._rng = random.Random(seed)
+    return _helper._iterative_deepening(own, opp, deadline)
+
+
+## Load the compiled kernel in this process, so that its first search does not pay for it.
+def _warm_up():
+    search_nb.search(0x0000000810000000, 0x0000001008000000, 1, NEG_INF, POS_INF)
+    search_nb.solve_endgame(0xFFFFFFFFFFFFFFFE, 0, NEG_INF, POS_INF)
+
+
+## Shut down the helper processes and free the shared table of an agent.
+# @param executor The agent's ProcessPoolExecutor.
+# @param table The agent's SharedTable.
+def _release(executor, table):
+    executor.shutdown(wait=True)
+    table.close()
+    table.unlink()
 
 
 ## kkp56 AI Agent
 # Inherits from the game.Player class to provide an AI agent that uses a time-constrained search algorithm.
 class kkp56(game.Player):
     
-    ## The constructor for kkp56 class.
+    ## The constructor for kkp56 class. The compiled kernel is loaded here rather than on the first move, and so are the
+    # helper processes and the shared table when there is more than one worker, so that none of it eats into a move's
+    # time.
     # @param color Color of the agent ('O' for black, 'X' for white).
     # @param time_limit_ms Time limit for the agent to make a move, in milliseconds.
-    def __init__(self, color, time_limit_ms):
+    # @param workers The number of processes to search with, this one included (by default 1, no helper processes).
+    # @param null_move_pruning Whether to try null moves (see _search); off by default, as for AlphaBeta.
+    def __init__(self, color, time_limit_ms, workers=1, null_move_pruning=False):
         self.color = color
         self.time_limit_ms = time_limit_ms
+        self.workers = workers
+        self.null_move_pruning = null_move_pruning
+        self.tt = {}
+        self._node_counter = 0
+        self._next_check = NODES_PER_CHECK
+        self._deadline = None
+        self._rng = None
+        self._executor = None
+        self._table = None
+        _warm_up()
+        if self.workers > 1:
+            self._table = transposition.SharedTable()
+            self._executor = ProcessPoolExecutor(max_workers=self.workers - 1)
+            for _ in range(self.workers - 1):
+                self._executor.submit(_warm_up)
+            self._finalizer = weakref.finalize(self, _release, self._executor, self._table)
+
+    ## Shut down the helper processes and free the shared table; the agent cannot search with helpers afterwards.
+    def close(self):
+        if self._executor is not None:
+            self._finalizer()
+            self._executor = None
+            self._table = None
         
-    ## Evaluate the current board state.
-    # @param state The current state of the Othello board.
-    # @return The score of the board as evaluated by the state's scoring function.
-    def evaluate_board(self, state):
-        return state.score()
+    ## Evaluate a board position.
+    # @param own The discs of the player to move.
+    # @param opp The discs of the opponent.
+    # @return The disc differential from the perspective of the player to move.
+    def evaluate_board(self, own, opp):
+        return othello_bb.evaluate(own, opp)
     
     
-    ## Recursive function to perform a depth-limited search with alpha-beta pruning within a time limit.
-    # @param state The current state of the Othello board.
+    ## Order moves so the ones most likely to cause a cutoff are searched first.
+    # @param moves A bitboard of the moves to order.
+    # @param tt_move The square index of the best move stored in the transposition table, or None.
+    # @param ply The distance of the node from the root, which selects its killer moves.
+    # @return A list of square indices with the transposition table move first, then the killer moves, then by history
+    # score, then corners, with anti-corners last.
+    def _order_moves(self, moves, tt_move, ply):
+        history = self.history
+        killer, second_killer = self.killers[ply]
+        def key(square):
+            killer_rank = 0 if square == killer else 1 if square == second_killer else 2
+            return (square != tt_move, killer_rank, -history[square], -CORNER_BONUS.get(square, 0),
+                    ANTICORNER_PENALTY.get(square, 0))
+        squares = othello_bb.squares(moves)
+        if self._rng is not None:
+            # Helpers break ties in their own random order, so that they spread over different parts of the tree:
+            self._rng.shuffle(squares)
+        return sorted(squares, key=key)
+
+    ## Remember a move that caused a cutoff: it gains history score, and becomes the first killer move of its ply (the
+    # previous first killer becomes the second). Killers are tried right after the transposition table move, since a
+    # move that refutes one position often refutes its siblings too. They are kept by ply rather than by remaining
+    # depth, so that they still match the same nodes in the next, deeper iteration.
+    # @param square The square of the move.
+    # @param depth The remaining depth of the node where it caused the cutoff.
+    # @param ply The distance of that node from the root.
+    def _record_cutoff(self, square, depth, ply):
+        self.history[square] += depth * depth
+        killers = self.killers[ply]
+        if square != killers[0]:
+            killers[1] = killers[0]
+            killers[0] = square
+
+    ## Recursive function to perform a depth-limited negamax search with alpha-beta pruning within a time limit.
+    # Only the value is returned; the root, which also needs the move, is searched by _search_root.
+    # @param own The discs of the player to move.
+    # @param opp The discs of the opponent.
     # @param depth Current depth level of the search.
     # @param alpha Alpha value for alpha-beta pruning.
     # @param beta Beta value for alpha-beta pruning.
-    # @param maximizing_player Boolean to indicate if the current search is maximizing or minimizing.
-    # @param start_time The start time of the search to calculate elapsed time.
-    # @return A tuple of the best score found and the associated move, or (None, None) if time limit is exceeded.
-    def search_with_time_limit(self, state, depth, alpha, beta, maximizing_player, start_time):
-        if time.time() * 1000 - start_time >= self.time_limit_ms:
-            return None, None
-        if depth == 0 or state.game_over():
-            return self.evaluate_board(state), None
-
-        if maximizing_player:
-            value = float('-inf')
-            best_move = None
-            for move in state.generateMoves():
-                new_state = state.applyMoveCloning(move)
-                child_value, _ = self.search_with_time_limit(new_state, depth - 1, alpha, beta, False, start_time)
-                if child_value is not None and child_value > value:
-                    value = child_value
-                    best_move = move
-                alpha = max(alpha, value)
-                if alpha >= beta:
-                    break
-            return value, best_move
-        else:
-            value = float('inf')
-            best_move = None
-            for move in state.generateMoves():
-                new_state = state.applyMoveCloning(move)
-                child_value, _ = self.search_with_time_limit(new_state, depth - 1, alpha, beta, True, start_time)
-                if child_value is not None and child_value < value:
-                    value = child_value
-                    best_move = move
-                beta = min(beta, value)
-                if beta <= alpha:
-                    break
-            return value, best_move
+    # @param ply The distance of the node from the root (passes and null moves included).
+    # @param null_move Whether a null move may be tried (not right after another null move).
+    # @return The best score found for the player to move.
+    # @throws TimeoutError If the deadline set by choose_move passes during the search.
+    def _search(self, own, opp, depth, alpha, beta, ply, null_move=True):
+        self._node_counter += 1
+        if self._node_counter >= self._next_check:
+            if time.monotonic() >= self._deadline:
+                raise TimeoutError
+            self._next_check = self._node_counter + NODES_PER_CHECK
+        if depth == 0:
+            return self.evaluate_board(own, opp)
+        key = (own, opp)
+        value, alpha, beta, tt_move = transposition.probe(self.tt, key, depth, alpha, beta)
+        if value is not None:
+            return value
+
+        moves = othello_bb.legal_moves(own, opp)
+        if not moves:
+            if othello_bb.legal_moves(opp, own):
+                # The player to move has to pass:
+                return -self._search(opp, own, depth, -beta, -alpha, ply + 1)
+            return self.evaluate_board(own, opp)
+
+        empties = 64 - othello_bb.popcount(own | opp)
+        if (null_move and self.null_move_pruning and depth >= NULL_MOVE_MIN_DEPTH and beta < POS_INF
+                and empties > NULL_MOVE_MIN_EMPTIES and empties - depth > search_nb.END_THRESHOLD):
+            # Null move: if the opponent moving twice still leaves a score of beta or more, so will any real move. It is
+            # not tried where every line reaches the endgame solver, since its shallower search would not:
+            if -self._search(opp, own, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + 1, ply + 1, False) >= beta:
+                return beta
+
+        alpha_orig = alpha
+        value = NEG_INF
+        best_move = None
+        apply = othello_bb.apply
+        endgame = empties - 1 <= search_nb.END_THRESHOLD
+        kernel = 0 < depth - 1 <= search_nb.KERNEL_DEPTH and empties - depth > search_nb.END_THRESHOLD
+        for square in self._order_moves(moves, tt_move, ply):
+            new_own, new_opp = apply(own, opp, 1 << square)
+            if endgame:
+                # Close to the end the children are solved exactly, whatever depth is left. A solve can take as long as
+                # many regular nodes, so the clock is read after each one:
+                child_value = -search_nb.solve_endgame(new_opp, new_own, -beta, -alpha)
+                if time.monotonic() >= self._deadline:
+                    raise TimeoutError
+            elif kernel:
+                # Shallow subtrees are searched by the compiled kernel, which finishes each of them within a few
+                # milliseconds. The kernel does not solve the endgame, so subtrees that reach the solver's threshold
+                # stay here; otherwise the last iteration (see _iterative_deepening) would not be exact:
+                child_value = -search_nb.search(new_opp, new_own, depth - 1, -beta, -alpha)
+            else:
+                child_value = -self._search(new_opp, new_own, depth - 1, -beta, -alpha, ply + 1)
+            if child_value > value:
+                value = child_value
+                best_move = square
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                self._record_cutoff(square, depth, ply)
+                break
+
+        # The best move is still stored, for move ordering in later iterations:
+        transposition.store(self.tt, key, depth, value, alpha_orig, beta, best_move)
+        return value
+
+    ## Search the root position: like _search, but it also returns the best move, never tries a null move (the root
+    # needs a real move) and only takes the move to try first from the transposition table.
+    # @param own The discs of the player to move.
+    # @param opp The discs of the opponent.
+    # @param depth The depth of the iteration.
+    # @param alpha Alpha value for alpha-beta pruning.
+    # @param beta Beta value for alpha-beta pruning.
+    # @return A tuple of the best score found for the player to move and the square of the associated move.
+    # @throws TimeoutError If the deadline set by choose_move passes during the search.
+    def _search_root(self, own, opp, depth, alpha, beta):
+        key = (own, opp)
+        entry = self.tt.get(key)
+        tt_move = entry.best_move if entry is not None else None
+
+        alpha_orig = alpha
+        value = NEG_INF
+        best_move = None
+        apply = othello_bb.apply
+        empties = 64 - othello_bb.popcount(own | opp)
+        endgame = empties - 1 <= search_nb.END_THRESHOLD
+        kernel = 0 < depth - 1 <= search_nb.KERNEL_DEPTH and empties - depth > search_nb.END_THRESHOLD
+        for square in self._order_moves(othello_bb.legal_moves(own, opp), tt_move, 0):
+            new_own, new_opp = apply(own, opp, 1 << square)
+            if endgame:
+                child_value = -search_nb.solve_endgame(new_opp, new_own, -beta, -alpha)
+                if time.monotonic() >= self._deadline:
+                    raise TimeoutError
+            elif kernel:
+                child_value = -search_nb.search(new_opp, new_own, depth - 1, -beta, -alpha)
+            else:
+                child_value = -self._search(new_opp, new_own, depth - 1, -beta, -alpha, 1)
+            if child_value > value:
+                value = child_value
+                best_move = square
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                self._record_cutoff(square, depth, 0)
+                break
+
+        transposition.store(self.tt, key, depth, value, alpha_orig, beta, best_move)
+        return value, best_move
     
     
-    ## Choose the best move for the current player given the state of the game.
-    # @param state The current state of the Othello board.
-    # @return The best move determined by the search algorithm within the time limit.
-    def choose_move(self, state):
-        best_move = None
+    ## Search a position by iterative deepening until the deadline, keeping the result of the deepest completed
+    # iteration.
+    # @param own The discs of the player to move; the player must have a move.
+    # @param opp The discs of the opponent.
+    # @param deadline The time.monotonic() value at which to stop.
+    # @return A tuple of the deepest completed depth (0 if none) and the square of its best move.
+    def _iterative_deepening(self, own, opp, deadline):
+        # Cutoff counts and killer moves are kept across deepening iterations, so deeper iterations benefit from the
+        # shallower ones:
+        self.history = [0] * 64
+        self.killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        # Fall back on the best-ordered move if not even the first iteration completes in time:
+        best_move = self._order_moves(othello_bb.legal_moves(own, opp), None, 0)[0]
+        completed = 0
         depth = 1
-        best_value = float('-inf') if self.color == 'O' else float('inf')
-        start_time = time.time() * 1000
+        self._node_counter = 0
+        self._next_check = NODES_PER_CHECK
+        self._deadline = deadline
+
+        empties = 64 - othello_bb.popcount(own | opp)
+        values = []
 
-        while time.time() * 1000 - start_time < self.time_limit_ms:
-            value, move = self.search_with_time_limit(state, depth, float('-inf'), float('inf'), True, start_time)
-            if move is None:
+        while time.monotonic() < deadline:
+            # Search a narrow window around the expected value first; it prunes far more when the value barely changes.
+            # Odd and even depths end on different sides and their values swing apart, so centre on two iterations back.
+            if len(values) < 2:
+                alpha, beta = NEG_INF, POS_INF
+            else:
+                alpha, beta = values[-2] - ASPIRATION_WINDOW, values[-2] + ASPIRATION_WINDOW
+            try:
+                value, move = self._search_root(own, opp, depth, alpha, beta)
+                if value <= alpha or value >= beta:
+                    value, move = self._search_root(own, opp, depth, NEG_INF, POS_INF)
+            except TimeoutError:
+                # The interrupted iteration only explored part of the tree; keep the last completed one.
                 break
             best_move = move
-            best_value = value
+            completed = depth
+            values.append(value)
+            # Once every line reaches the end of the game or the endgame solver, the value is exact and cannot improve:
+            if depth >= empties - search_nb.END_THRESHOLD:
+                break
             depth += 1
-        
-        return best_move
+        return completed, best_move
+
+    ## Choose the best move for the current player given the state of the game.
+    # @param state The current state of the Othello board.
+    # @return The best move determined by the search algorithm within the time limit.
+    def choose_move(self, state):
+        own, opp = othello_bb.from_state(state)
+        if not othello_bb.legal_moves(own, opp):
+            return None
+        deadline = time.monotonic() + self.time_limit_ms / 1000.0
+        if self._executor is None:
+            self.tt = {}
+            return othello_bb.to_move(state, self._iterative_deepening(own, opp, deadline)[1])
+
+        # Every move adds a disc, so entries left in the shared table from earlier moves can never match again and the
+        # table is not cleared; new entries simply replace them.
+        self.tt = self._table
+        helpers = [self._executor.submit(_helper_search, own, opp, deadline, self._table.name, seed,
+                                         self.null_move_pruning)
+                   for seed in range(1, self.workers)]
+        depth, best_move = self._iterative_deepening(own, opp, deadline)
+        done, _ = wait(helpers, timeout=HELPER_GRACE)
+        for helper in done:
+            helper_depth, helper_move = helper.result()
+            if helper_depth > depth:
+                depth, best_move = helper_depth, helper_move
+        return othello_bb.to_move(state, best_move)
@@ -1,7 +1,6 @@
 import math
 import random
 import sys
-import copy
 
 EMPTY = 2
 PLAYER1 = 0
@@ -40,6 +39,9 @@ class State:
             self.board[boardSize//2][boardSize//2] = PLAYER1
             self.board[boardSize//2-1][boardSize//2] = PLAYER2
             self.board[boardSize//2][boardSize//2-1] = PLAYER2
+
+        # Moves already generated for each player (generateMoves is called several times per turn):
+        self._cached_moves = [None, None]
     
     # Converts a game board to a string, for displaying it via the console
     def __str__(self):
@@ -54,7 +56,7 @@ class State:
         return self.board == state.board
 
     def clone(self):
-        return State(copy.deepcopy(self.board), self.boardSize, self.nextPlayerToMove)
+        return State([row[:] for row in self.board], self.boardSize, self.nextPlayerToMove)
 
     def is_legal(self, x, y):
         return x >= 0 and x < self.boardSize and y >= 0 and y < self.boardSize
@@ -88,10 +90,13 @@ class State:
         return score
     
     #  Returns the list of possible moves for player 'player'
+    #  The list is cached until the next applyMove, so callers must not modify it.
     def generateMoves(self, player = None):
 
         if player == None:
             player = self.nextPlayerToMove
+        if self._cached_moves[player] is not None:
+            return self._cached_moves[player]
         moves = []
 
         # these two arrays encode the 8 posible directions in which a player can capture pieces:
@@ -115,6 +120,7 @@ class State:
                                     #  Legal move:
                                     moveFound = True
                                     moves.append(OthelloMove(player, i, j))
+        self._cached_moves[player] = moves
         return moves
 
 
@@ -124,6 +130,7 @@ class State:
     # "passing" is only allowed if a player has no other moves available.
     def applyMove(self, move):
 
+        self._cached_moves = [None, None]
         if move == None:
             print("\nPlayer " + PLAYER_NAMES[self.nextPlayerToMove] + " passes the move!")
             self.nextPlayerToMove = OTHER_PLAYER[self.nextPlayerToMove]
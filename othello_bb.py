@@ -0,0 +1,297 @@
+# Purpose: This module implements a bitboard representation of the Othello board used internally by the search agents.
+#          A position is a pair of 64-bit integers (own, opp) holding the discs of the player to move and of the opponent,
+#          with square (x, y) of othello.State.board stored in bit x * 8 + y. Move generation works on all squares at
+#          once with shifts and masks, and flipping reads the flipped discs of each line through the square played from
+#          precomputed tables, so searching a node costs a handful of integer operations instead of cloning a State. When
+#          NumPy is available, frontier_values() also searches a whole batch of positions one ply deep at once, with
+#          shifts and masks applied to arrays of bitboards.
+
+import othello
+
+try:
+    import numpy as np
+    BATCH = True
+except ImportError:
+    np = None
+    BATCH = False
+
+FULL = 0xFFFFFFFFFFFFFFFF
+
+## Every column except the two edge columns (y == 0 and y == 7). Masking the opponent's discs with it before shifting
+#  sideways or diagonally stops runs from wrapping around from one row into the next.
+INNER_COLUMNS = 0x7E7E7E7E7E7E7E7E
+
+## (shift, mask) pairs for the four line directions; each is walked both ways, with << and with >>.
+DIRECTIONS = ((1, INNER_COLUMNS), (8, FULL), (7, INNER_COLUMNS), (9, INNER_COLUMNS))
+
+## Ordering bonus for the corner squares (square index = x * 8 + y); corners can never be flipped back.
+CORNER_BONUS = {0: 3, 7: 3, 56: 3, 63: 3}
+
+## Ordering penalty for the squares next to a corner, which usually hand that corner to the opponent.
+ANTICORNER_PENALTY = {1: 1, 6: 1, 8: 1, 9: 1, 14: 1, 15: 1, 48: 1, 49: 1, 54: 1, 55: 1, 57: 1, 62: 1}
+
+## Null-move pruning settings shared by the search agents: the minimum remaining depth to try a null move at, how much
+#  shallower than a real move the null move is searched, and the number of empty squares at or below which it is no
+#  longer tried, since towards the end being forced to move can be a disadvantage and the null move would misjudge
+#  such positions.
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_EMPTIES = 12
+
+
+## Count the set bits of a bitboard.
+#  @param x The bitboard.
+#  @return The number of discs in it.
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+else:
+    def popcount(x):
+        return bin(x).count('1')
+
+
+## Convert an othello.State into a bitboard pair.
+#  @param state The current state of the Othello game.
+#  @return A tuple (own, opp) from the point of view of the player to move.
+def from_state(state):
+    own = opp = 0
+    player = state.nextPlayerToMove
+    for x in range(8):
+        row = state.board[x]
+        for y in range(8):
+            if row[y] == player:
+                own |= 1 << (x * 8 + y)
+            elif row[y] != othello.EMPTY:
+                opp |= 1 << (x * 8 + y)
+    return own, opp
+
+
+## Convert a square index back into a move on an othello.State.
+#  @param state The state the move is played on.
+#  @param square The square index (x * 8 + y), or None for a pass.
+#  @return The corresponding othello.OthelloMove, or None.
+def to_move(state, square):
+    if square is None:
+        return None
+    return othello.OthelloMove(state.nextPlayerToMove, square // 8, square % 8)
+
+
+## List the square indices of the set bits of a bitboard, in increasing order.
+#  @param x The bitboard.
+#  @return A list of square indices.
+def squares(x):
+    result = []
+    while x:
+        bit = x & -x
+        result.append(bit.bit_length() - 1)
+        x ^= bit
+    return result
+
+
+## Generate the legal moves of the player to move.
+#  @param own The discs of the player to move.
+#  @param opp The discs of the opponent.
+#  @return A bitboard with one bit set per legal move.
+def legal_moves(own, opp):
+    empty = ~(own | opp) & FULL
+    moves = 0
+    for shift, mask in DIRECTIONS:
+        o = opp & mask
+        # Runs of opponent discs adjacent to one of ours, extended up to the six squares a run can span:
+        x = (own << shift) & o
+        x |= (x << shift) & o
+        x |= (x << shift) & o
+        x |= (x << shift) & o
+        x |= (x << shift) & o
+        x |= (x << shift) & o
+        moves |= (x << shift) & empty
+        x = (own >> shift) & o
+        x |= (x >> shift) & o
+        x |= (x >> shift) & o
+        x |= (x >> shift) & o
+        x |= (x >> shift) & o
+        x |= (x >> shift) & o
+        moves |= (x >> shift) & empty
+    return moves
+
+
+## Build the lookup tables used by flips(). Each square lies on four lines (its row, its column and its two diagonals);
+#  for each of them the table entry holds how to gather the line into an 8-bit pattern, (x & mask) * magic >> shift,
+#  plus two tables indexed by such patterns: outflank, which maps the opponent's pattern to the squares that would
+#  close a run of opponent discs next to the square, and flip, which maps the closing squares that hold one of our
+#  discs to the discs flipped on the board.
+#  @return A list indexed by square of tuples of four (mask, magic, shift, outflank, flip) tuples.
+def _build_line_tables():
+    outflank_tables = {}
+    lines = []
+    for square in range(64):
+        x, y = divmod(square, 8)
+        row = [x * 8 + i for i in range(8)]
+        column = [(7 - i) * 8 + y for i in range(8)]
+        diagonal = [None] * 8
+        antidiagonal = [None] * 8
+        for other in range(64):
+            if other // 8 - other % 8 == x - y:
+                diagonal[other % 8] = other
+            if other // 8 + other % 8 == x + y:
+                antidiagonal[other % 8] = other
+        # (squares in pattern bit order, magic, shift, position of the square in the pattern); the magic multipliers
+        # move every square of the line into a distinct bit of the top byte, without carries:
+        specs = [(row, 1, x * 8, y),
+                 (column, 0x8040201008040201, 56 + y, 7 - x),
+                 (diagonal, 0x0101010101010101, 56, y),
+                 (antidiagonal, 0x0101010101010101, 56, y)]
+        entries = []
+        for line, magic, shift, position in specs:
+            mask = sum(1 << other for other in line if other is not None)
+            valid = tuple(other is not None for other in line)
+            outflank = outflank_tables.get((position, valid))
+            if outflank is None:
+                outflank = [0] * 256
+                for pattern in range(256):
+                    for step in (1, -1):
+                        i = position + step
+                        while 0 <= i < 8 and valid[i] and pattern >> i & 1:
+                            i += step
+                        if i != position + step and 0 <= i < 8 and valid[i]:
+                            outflank[pattern] |= 1 << i
+                outflank_tables[(position, valid)] = outflank
+            between = [0] * 8
+            for i in range(8):
+                if valid[i]:
+                    low, high = sorted((i, position))
+                    between[i] = sum(1 << line[k] for k in range(low + 1, high))
+            flip = [0] * 256
+            for pattern in range(1, 256):
+                bit = pattern & -pattern
+                flip[pattern] = flip[pattern ^ bit] | between[bit.bit_length() - 1]
+            entries.append((mask, magic, shift, outflank, flip))
+        lines.append(tuple(entries))
+    return lines
+
+
+## Line lookup tables for flips(), indexed by square (see _build_line_tables).
+LINES = _build_line_tables()
+
+
+## Compute the discs flipped by a move. Rather than walking each direction, every line through the square is gathered
+#  into an 8-bit pattern and the flipped discs are read from the lookup tables.
+#  @param own The discs of the player to move.
+#  @param opp The discs of the opponent.
+#  @param move The bit of the square being played.
+#  @return A bitboard of the opponent discs that the move flips.
+def flips(own, opp, move):
+    flipped = 0
+    for mask, magic, shift, outflank, flip in LINES[move.bit_length() - 1]:
+        closing = outflank[((opp & mask) * magic >> shift) & 0xFF]
+        flipped |= flip[closing & ((own & mask) * magic >> shift)]
+    return flipped
+
+
+## Play a move.
+#  @param own The discs of the player to move.
+#  @param opp The discs of the opponent.
+#  @param move The bit of the square being played; it must be a legal move.
+#  @return A tuple (own, opp) after the move, still from the point of view of the player who moved.
+def apply(own, opp, move):
+    flipped = flips(own, opp, move)
+    return own | move | flipped, opp ^ flipped
+
+
+## Evaluate a position as the disc differential.
+#  @param own The discs of the player to move.
+#  @param opp The discs of the opponent.
+#  @return The number of discs of the player to move minus the number of opponent discs.
+def evaluate(own, opp):
+    return popcount(own) - popcount(opp)
+
+
+if BATCH:
+    _ZERO = np.uint64(0)
+    _ONE = np.uint64(1)
+    _DIRECTIONS_NP = tuple((np.uint64(shift), np.uint64(mask)) for shift, mask in DIRECTIONS)
+    _SQUARES_NP = np.arange(64, dtype=np.uint64)
+    _M1 = np.uint64(0x5555555555555555)
+    _M2 = np.uint64(0x3333333333333333)
+    _M4 = np.uint64(0x0F0F0F0F0F0F0F0F)
+    _H01 = np.uint64(0x0101010101010101)
+
+
+## Count the set bits of every bitboard in an array.
+#  @param x A uint64 array of bitboards.
+#  @return An int64 array of disc counts.
+def _popcount_np(x):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x).astype(np.int64)
+    x = x - ((x >> _ONE) & _M1)
+    x = (x & _M2) + ((x >> np.uint64(2)) & _M2)
+    x = (x + (x >> np.uint64(4))) & _M4
+    return ((x * _H01) >> np.uint64(56)).astype(np.int64)
+
+
+## Generate the legal moves of every position in a batch (see legal_moves).
+#  @param own A uint64 array of the discs of the player to move.
+#  @param opp A uint64 array of the discs of the opponent.
+#  @return A uint64 array of move bitboards.
+def _legal_moves_np(own, opp):
+    empty = ~(own | opp)
+    moves = np.zeros_like(own)
+    for shift, mask in _DIRECTIONS_NP:
+        o = opp & mask
+        x = (own << shift) & o
+        for _ in range(5):
+            x |= (x << shift) & o
+        moves |= (x << shift) & empty
+        x = (own >> shift) & o
+        for _ in range(5):
+            x |= (x >> shift) & o
+        moves |= (x >> shift) & empty
+    return moves
+
+
+## Compute the discs flipped by every move of a batch (see flips).
+#  @param own A uint64 array of the discs of the player to move.
+#  @param opp A uint64 array of the discs of the opponent.
+#  @param move A uint64 array holding the bit of the square played in each position.
+#  @return A uint64 array of flipped discs.
+def _flips_np(own, opp, move):
+    flipped = np.zeros_like(own)
+    for shift, mask in _DIRECTIONS_NP:
+        o = opp & mask
+        # Unlike flips(), every run is extended to its full length so that all positions take the same steps:
+        x = (move << shift) & o
+        for _ in range(5):
+            x |= (x << shift) & o
+        flipped |= np.where(((x << shift) & own) != _ZERO, x, _ZERO)
+        x = (move >> shift) & o
+        for _ in range(5):
+            x |= (x >> shift) & o
+        flipped |= np.where(((x >> shift) & own) != _ZERO, x, _ZERO)
+    return flipped
+
+
+## Search a batch of positions one ply deep in a single vectorized pass: every move of every position is played and
+#  evaluated at once, and each position gets the best of its children. Positions without a move are scored as
+#  finished games, so the caller has to resolve passes itself.
+#  @param owns A list of the discs of the player to move, one per position.
+#  @param opps A list of the discs of the opponent, one per position.
+#  @return A list with the value of each position for the player to move.
+def frontier_values(owns, opps):
+    own = np.array(owns, dtype=np.uint64)
+    opp = np.array(opps, dtype=np.uint64)
+    moves = _legal_moves_np(own, opp)
+    counts = _popcount_np(moves)
+    values = _popcount_np(own) - _popcount_np(opp)
+
+    # One row per (position, move) pair, grouped by position, so the children of a position form a contiguous slice:
+    parents, move_squares = np.nonzero((moves[:, None] >> _SQUARES_NP) & _ONE)
+    if parents.size:
+        move = _ONE << move_squares.astype(np.uint64)
+        child_own = own[parents]
+        child_opp = opp[parents]
+        flipped = _flips_np(child_own, child_opp, move)
+        # Scored from the point of view of the player who moved, i.e. already negated:
+        children = _popcount_np(child_own | move | flipped) - _popcount_np(child_opp ^ flipped)
+        has_moves = counts > 0
+        starts = (np.cumsum(counts) - counts)[has_moves]
+        values[has_moves] = np.maximum.reduceat(children, starts)
+    return values.tolist()
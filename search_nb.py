@@ -0,0 +1,362 @@
+# Purpose: This module implements a compiled alpha-beta kernel for the last few plies of the search. The kernel works on
+#          the same bitboards as othello_bb, but is written with fixed-width integer operations only so that Numba can
+#          compile it in nopython mode, removing the interpreter overhead on the nodes that dominate the search (the ones
+#          close to the leaves). The agents keep their transposition table and move ordering for the upper part of the
+#          tree and hand every subtree of depth KERNEL_DEPTH or less over to search(). Numba is optional: without it the
+#          module still imports, JIT is False and KERNEL_DEPTH is 0, so the agents search every node themselves.
+
+import othello_bb
+
+try:
+    import numpy as np
+    from numba import njit
+    JIT = True
+    U64 = np.uint64
+    I64 = np.int64
+    zeros = np.zeros
+except ImportError:
+    JIT = False
+    U64 = I64 = int
+
+    ## Stand-in for numba.njit when Numba is not installed; returns the function unchanged.
+    def njit(*args, **kwargs):
+        return lambda function: function
+
+    ## Stand-in for numpy.zeros when Numba is not installed; returns a list.
+    def zeros(size, dtype):
+        return [dtype(0)] * size
+
+## Subtrees with at most this many plies left are searched by the kernel.
+KERNEL_DEPTH = 5 if JIT else 0
+
+## Positions with at most this many empty squares are solved exactly to the end of the game by solve_endgame(). The
+#  solver is not interrupted by time limits, so the thresholds keep a solve within a few tens of milliseconds.
+END_THRESHOLD = 12 if JIT else 6
+
+## Above this many empty squares the endgame solver orders moves fastest-first.
+FASTEST_FIRST_EMPTIES = 6
+
+## Bound used in place of infinity, since the kernel works on 64-bit integers.
+INF = 1000000
+
+FULL = U64(0xFFFFFFFFFFFFFFFF)
+INNER_COLUMNS = U64(0x7E7E7E7E7E7E7E7E)
+CORNERS = U64(0x8100000000000081)
+ANTICORNERS = U64(0x42C300000000C342)
+ZERO = U64(0)
+ONE = U64(1)
+SHIFTS = (U64(1), U64(8), U64(7), U64(9))
+MASKS = (INNER_COLUMNS, FULL, INNER_COLUMNS, INNER_COLUMNS)
+BYTE = U64(0xFF)
+
+## The line lookup tables of othello_bb.LINES as flat arrays: line square * 4 + i is the i-th line through a square,
+#  and its outflank and flip tables start at index line * 256. Products are cut to 64 bits here, so the part of
+#  othello_bb's shift that would move the top byte past bit 63 is applied before the multiplication instead, as pre;
+#  post is the rest of the shift.
+LINE_MASK = zeros(256, U64)
+LINE_MAGIC = zeros(256, U64)
+LINE_PRE = zeros(256, U64)
+LINE_POST = zeros(256, U64)
+OUTFLANK = zeros(256 * 256, U64)
+FLIP = zeros(256 * 256, U64)
+for _square, _entries in enumerate(othello_bb.LINES):
+    for _i, (_mask, _magic, _shift, _outflank, _flip) in enumerate(_entries):
+        _line = _square * 4 + _i
+        LINE_MASK[_line] = U64(_mask)
+        LINE_MAGIC[_line] = U64(_magic)
+        LINE_PRE[_line] = U64(max(_shift - 56, 0))
+        LINE_POST[_line] = U64(min(_shift, 56))
+        OUTFLANK[_line * 256:_line * 256 + 256] = _outflank
+        FLIP[_line * 256:_line * 256 + 256] = _flip
+
+_M1 = U64(0x5555555555555555)
+_M2 = U64(0x3333333333333333)
+_M4 = U64(0x0F0F0F0F0F0F0F0F)
+_H01 = U64(0x0101010101010101)
+
+
+## Count the set bits of a bitboard without branches.
+#  @param x The bitboard.
+#  @return The number of set bits.
+@njit(cache=True)
+def popcount(x):
+    x = x - ((x >> ONE) & _M1)
+    x = (x & _M2) + ((x >> U64(2)) & _M2)
+    x = (x + (x >> U64(4))) & _M4
+    return I64(((x * _H01) & FULL) >> U64(56))
+
+
+## Generate the legal moves of the player to move (see othello_bb.legal_moves).
+#  @param own The discs of the player to move.
+#  @param opp The discs of the opponent.
+#  @return A bitboard with one bit set per legal move.
+@njit(cache=True)
+def legal_moves(own, opp):
+    empty = ~(own | opp) & FULL
+    moves = ZERO
+    for i in range(4):
+        shift = SHIFTS[i]
+        o = opp & MASKS[i]
+        x = (own << shift) & o
+        x |= (x << shift) & o
+        x |= (x << shift) & o
+        x |= (x << shift) & o
+        x |= (x << shift) & o
+        x |= (x << shift) & o
+        moves |= (x << shift) & empty
+        x = (own >> shift) & o
+        x |= (x >> shift) & o
+        x |= (x >> shift) & o
+        x |= (x >> shift) & o
+        x |= (x >> shift) & o
+        x |= (x >> shift) & o
+        moves |= (x >> shift) & empty
+    return moves
+
+
+## Compute the discs flipped by a move (see othello_bb.flips), with the line lookup tables.
+#  @param own The discs of the player to move.
+#  @param opp The discs of the opponent.
+#  @param move The bit of the square being played.
+#  @return A bitboard of the opponent discs that the move flips.
+@njit(cache=True)
+def flips(own, opp, move):
+    first = U64(popcount(move - ONE)) << U64(2)
+    flipped = ZERO
+    for i in range(4):
+        line = first + U64(i)
+        mask = LINE_MASK[line]
+        magic = LINE_MAGIC[line]
+        pre = LINE_PRE[line]
+        post = LINE_POST[line]
+        # Indices are kept unsigned throughout; mixing them with signed integers would make Numba use floats:
+        closing = OUTFLANK[(line << U64(8)) | (((((opp & mask) >> pre) * magic) >> post) & BYTE)]
+        flipped |= FLIP[(line << U64(8)) | (closing & ((((own & mask) >> pre) * magic) >> post))]
+    return flipped
+
+
+## Evaluate a position as the disc differential (see othello_bb.evaluate).
+#  @param own The discs of the player to move.
+#  @param opp The discs of the opponent.
+#  @return The number of discs of the player to move minus the number of opponent discs.
+@njit(cache=True)
+def evaluate(own, opp):
+    return popcount(own) - popcount(opp)
+
+
+## Fail-soft alpha-beta search in negamax form. Moves are tried corners first and anti-corners last.
+#  The tree is walked with an explicit stack of frames rather than by recursion, one array slot per ply.
+#  @param own The discs of the player to move.
+#  @param opp The discs of the opponent.
+#  @param depth The remaining depth.
+#  @param alpha The alpha value for pruning.
+#  @param beta The beta value for pruning.
+#  @return The value of the position for the player to move.
+@njit(cache=True)
+def negamax(own, opp, depth, alpha, beta):
+    # A pass does not use up depth, but two passes in a row end the game, so 2 * depth + 1 frames are enough:
+    size = 2 * depth + 2
+    s_own = zeros(size, U64)
+    s_opp = zeros(size, U64)
+    s_rest = zeros(size, U64)
+    s_depth = zeros(size, I64)
+    s_alpha = zeros(size, I64)
+    s_beta = zeros(size, I64)
+    s_best = zeros(size, I64)
+    s_own[0] = own
+    s_opp[0] = opp
+    s_depth[0] = depth
+    s_alpha[0] = alpha
+    s_beta[0] = beta
+    sp = 0
+    while True:
+        # Enter the node on top of the stack: it is either finished on the spot or gets the list of moves left to try.
+        own = s_own[sp]
+        opp = s_opp[sp]
+        depth = s_depth[sp]
+        moves = ZERO
+        if depth > 0:
+            moves = legal_moves(own, opp)
+        finished = True
+        if depth == 0 or (not moves and not legal_moves(opp, own)):
+            value = evaluate(own, opp)
+        elif depth == 1 and moves:
+            # The children are leaves: evaluate them in place instead of pushing a frame for each.
+            value = -INF
+            beta = s_beta[sp]
+            while moves:
+                move = moves & (~moves + ONE)
+                moves ^= move
+                flipped = flips(own, opp, move)
+                child = evaluate(own | move | flipped, opp ^ flipped)
+                if child > value:
+                    value = child
+                    if value >= beta:
+                        break
+        else:
+            s_rest[sp] = moves
+            s_best[sp] = -INF
+            finished = False
+        if finished:
+            # Pop finished nodes, folding each value into its parent, until a parent has a move left to try:
+            while True:
+                if sp == 0:
+                    return value
+                sp -= 1
+                value = -value
+                if value > s_best[sp]:
+                    s_best[sp] = value
+                    if value > s_alpha[sp]:
+                        s_alpha[sp] = value
+                if s_rest[sp] and s_alpha[sp] < s_beta[sp]:
+                    break
+                value = s_best[sp]
+            own = s_own[sp]
+            opp = s_opp[sp]
+
+        # Push the next child of node sp; a node without moves pushes a single pass.
+        rest = s_rest[sp]
+        if rest:
+            m = rest & CORNERS
+            if not m:
+                m = rest & ~ANTICORNERS & FULL
+                if not m:
+                    m = rest
+            move = m & (~m + ONE)
+            s_rest[sp] = rest ^ move
+            flipped = flips(own, opp, move)
+            s_own[sp + 1] = opp ^ flipped
+            s_opp[sp + 1] = own | move | flipped
+            s_depth[sp + 1] = s_depth[sp] - 1
+        else:
+            s_own[sp + 1] = opp
+            s_opp[sp + 1] = own
+            s_depth[sp + 1] = s_depth[sp]
+        s_alpha[sp + 1] = -s_beta[sp]
+        s_beta[sp + 1] = -s_alpha[sp]
+        sp += 1
+
+
+## Exact alpha-beta search to the end of the game, scored by the final disc differential. Near the end the branching
+#  factor is small and the evaluation trivial, so searching every line to the last move costs little more than a
+#  depth-limited search. With more than FASTEST_FIRST_EMPTIES empty squares, the moves that leave the opponent the
+#  fewest replies are tried first, which keeps the tree narrow; closer to the end the ordering costs more than it saves.
+#  Like negamax, the tree is walked with an explicit stack; each frame keeps its ordered moves in a slice of s_moves.
+#  @param own The discs of the player to move.
+#  @param opp The discs of the opponent.
+#  @param alpha The alpha value for pruning.
+#  @param beta The beta value for pruning.
+#  @return The final disc differential for the player to move under perfect play (a bound outside the window).
+@njit(cache=True)
+def solve(own, opp, alpha, beta):
+    # Every move fills a square and a pass is never followed by another one, so 2 * empties + 1 frames are enough:
+    size = 2 * (64 - popcount(own | opp)) + 2
+    s_own = zeros(size, U64)
+    s_opp = zeros(size, U64)
+    s_alpha = zeros(size, I64)
+    s_beta = zeros(size, I64)
+    s_best = zeros(size, I64)
+    s_count = zeros(size, I64)
+    s_next = zeros(size, I64)
+    s_moves = zeros(size * 64, U64)
+    s_replies = zeros(64, I64)
+    s_own[0] = own
+    s_opp[0] = opp
+    s_alpha[0] = alpha
+    s_beta[0] = beta
+    sp = 0
+    while True:
+        own = s_own[sp]
+        opp = s_opp[sp]
+        moves = legal_moves(own, opp)
+        empties = 64 - popcount(own | opp)
+        finished = True
+        if not moves and not legal_moves(opp, own):
+            value = evaluate(own, opp)
+        elif empties == 1 and moves:
+            # The only move ends the game:
+            flipped = flips(own, opp, moves)
+            value = evaluate(own | moves | flipped, opp ^ flipped)
+        else:
+            base = sp * 64
+            count = 0
+            if not moves:
+                # A single pass, stored as an empty move:
+                s_moves[base] = ZERO
+                count = 1
+            while moves:
+                move = moves & (~moves + ONE)
+                moves ^= move
+                if empties > FASTEST_FIRST_EMPTIES:
+                    # Insert by number of replies left to the opponent, fewest first:
+                    flipped = flips(own, opp, move)
+                    replies = popcount(legal_moves(opp ^ flipped, own | move | flipped))
+                    i = count
+                    while i > 0 and s_replies[i - 1] > replies:
+                        s_replies[i] = s_replies[i - 1]
+                        s_moves[base + i] = s_moves[base + i - 1]
+                        i -= 1
+                    s_replies[i] = replies
+                    s_moves[base + i] = move
+                else:
+                    s_moves[base + count] = move
+                count += 1
+            s_count[sp] = count
+            s_next[sp] = 0
+            s_best[sp] = -INF
+            finished = False
+        if finished:
+            # Pop finished nodes, folding each value into its parent, until a parent has a move left to try:
+            while True:
+                if sp == 0:
+                    return value
+                sp -= 1
+                value = -value
+                if value > s_best[sp]:
+                    s_best[sp] = value
+                    if value > s_alpha[sp]:
+                        s_alpha[sp] = value
+                if s_next[sp] < s_count[sp] and s_alpha[sp] < s_beta[sp]:
+                    break
+                value = s_best[sp]
+            own = s_own[sp]
+            opp = s_opp[sp]
+
+        # Push the next child of node sp:
+        move = s_moves[sp * 64 + s_next[sp]]
+        s_next[sp] += 1
+        if move:
+            flipped = flips(own, opp, move)
+            s_own[sp + 1] = opp ^ flipped
+            s_opp[sp + 1] = own | move | flipped
+        else:
+            s_own[sp + 1] = opp
+            s_opp[sp + 1] = own
+        s_alpha[sp + 1] = -s_beta[sp]
+        s_beta[sp + 1] = -s_alpha[sp]
+        sp += 1
+
+
+## Solve the rest of the game from a position with the kernel.
+#  @param own The discs of the player to move, as a Python int.
+#  @param opp The discs of the opponent, as a Python int.
+#  @param alpha The alpha value for pruning (may be infinite).
+#  @param beta The beta value for pruning (may be infinite).
+#  @return The final disc differential for the player to move under perfect play.
+def solve_endgame(own, opp, alpha, beta):
+    alpha = int(max(alpha, -INF))
+    beta = int(min(beta, INF))
+    return int(solve(U64(own), U64(opp), alpha, beta))
+
+
+## Search a position with the kernel.
+#  @param own The discs of the player to move, as a Python int.
+#  @param opp The discs of the opponent, as a Python int.
+#  @param depth The remaining depth.
+#  @param alpha The alpha value for pruning (may be infinite).
+#  @param beta The beta value for pruning (may be infinite).
+#  @return The value of the position for the player to move.
+def search(own, opp, depth, alpha, beta):
+    alpha = int(max(alpha, -INF))
+    beta = int(min(beta, INF))
+    return int(negamax(U64(own), U64(opp), depth, alpha, beta))
@@ -0,0 +1,98 @@
+# Purpose: Regression checks for the bitboard move generation and the line lookup tables, in othello_bb, in the
+#          compiled copies of search_nb and in the NumPy batch search, against the board updates of othello.State.
+#          Run with python -m unittest.
+
+import contextlib
+import io
+import random
+import unittest
+
+import agent
+import othello
+import othello_bb
+import search_nb
+
+## Number of random games played through by each check.
+GAMES = 100
+
+
+## Play random games and yield every position reached together with the move played from it.
+#  @param seed Seed of the random move choices.
+#  @return A generator of tuples (state, move, next_state); move is None when the player to move passes.
+def random_positions(seed):
+    rng = random.Random(seed)
+    for _ in range(GAMES):
+        state = othello.State()
+        while not state.game_over():
+            moves = state.generateMoves()
+            move = rng.choice(moves) if moves else None
+            # applyMove announces passes on stdout:
+            with contextlib.redirect_stdout(io.StringIO()):
+                next_state = state.applyMoveCloning(move)
+            yield state, move, next_state
+            state = next_state
+
+
+class BitboardTest(unittest.TestCase):
+
+    def test_legal_moves(self):
+        for state, _, _ in random_positions(1):
+            own, opp = othello_bb.from_state(state)
+            expected = sorted({move.x * 8 + move.y for move in state.generateMoves()})
+            self.assertEqual(othello_bb.squares(othello_bb.legal_moves(own, opp)), expected)
+            self.assertEqual(int(search_nb.legal_moves(search_nb.U64(own), search_nb.U64(opp))),
+                             othello_bb.legal_moves(own, opp))
+
+    def test_flips(self):
+        for state, move, next_state in random_positions(2):
+            if move is None:
+                continue
+            own, opp = othello_bb.from_state(state)
+            bit = 1 << (move.x * 8 + move.y)
+            # The discs State.applyMove flipped are the opponent discs that now belong to the player who moved:
+            expected = opp & othello_bb.from_state(next_state)[1]
+            self.assertEqual(othello_bb.flips(own, opp, bit), expected)
+            self.assertEqual(int(search_nb.flips(search_nb.U64(own), search_nb.U64(opp), search_nb.U64(bit))), expected)
+
+    def test_apply(self):
+        for state, move, next_state in random_positions(3):
+            if move is None:
+                continue
+            own, opp = othello_bb.from_state(state)
+            new_own, new_opp = othello_bb.apply(own, opp, 1 << (move.x * 8 + move.y))
+            self.assertEqual((new_opp, new_own), othello_bb.from_state(next_state))
+            sign = 1 if next_state.nextPlayerToMove == othello.PLAYER1 else -1
+            self.assertEqual(othello_bb.evaluate(new_opp, new_own), sign * next_state.score())
+
+
+@unittest.skipUnless(othello_bb.BATCH, 'NumPy is not installed')
+class BatchTest(unittest.TestCase):
+
+    def test_frontier_values(self):
+        positions = [othello_bb.from_state(state) for state, _, _ in random_positions(4)]
+        expected = []
+        for own, opp in positions:
+            moves = othello_bb.squares(othello_bb.legal_moves(own, opp))
+            if moves:
+                expected.append(max(othello_bb.evaluate(*othello_bb.apply(own, opp, 1 << square)) for square in moves))
+            else:
+                expected.append(othello_bb.evaluate(own, opp))
+        self.assertEqual(othello_bb.frontier_values([own for own, _ in positions], [opp for _, opp in positions]),
+                         expected)
+
+    def test_minimax_batched(self):
+        minimax = agent.MinimaxAgent(3, 'O')
+        for i, (state, _, _) in enumerate(random_positions(5)):
+            # Every 10th position, since the pure-Python minimax is slow:
+            if i % 10:
+                continue
+            own, opp = othello_bb.from_state(state)
+            for depth in (1, 2, 3):
+                minimax.tt = {}
+                expected = minimax.minimax(own, opp, depth)
+                minimax.tt = {}
+                self.assertEqual(minimax.minimax_batched(own, opp, depth), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
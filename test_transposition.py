@@ -0,0 +1,53 @@
+# Purpose: Regression checks for the transposition table helpers: storing entries in a SharedTable and reading them
+#          back, from the same process and from a second handle attached by name. Run with python -m unittest.
+
+import unittest
+
+import transposition
+from transposition import EXACT, LOWER, UPPER, TTEntry
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+@unittest.skipUnless(shared_memory, 'multiprocessing.shared_memory needs Python 3.8')
+class SharedTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = transposition.SharedTable()
+
+    def tearDown(self):
+        self.table.close()
+        self.table.unlink()
+
+    def test_round_trip(self):
+        entries = {
+            (0x0000000810000000, 0x0000001008000000): TTEntry(0, EXACT, 0, None),
+            (0x1, 0x2): TTEntry(255, LOWER, 32767, 63),
+            (0x4, 0x8): TTEntry(7, UPPER, -32768, 0),
+            (0xFFFFFFFFFFFFFFFE, 0x1): TTEntry(12, EXACT, -64, 27),
+        }
+        for key, entry in entries.items():
+            self.table[key] = entry
+        attached = transposition.SharedTable(self.table.name)
+        try:
+            for key, entry in entries.items():
+                self.assertEqual(self.table.get(key), entry)
+                self.assertEqual(attached.get(key), entry)
+        finally:
+            attached.close()
+
+    def test_missing(self):
+        self.assertIsNone(self.table.get((0x10, 0x20)))
+
+    def test_out_of_range(self):
+        for entry in (TTEntry(0, EXACT, 32768, None), TTEntry(0, EXACT, -32769, None), TTEntry(256, EXACT, 0, None),
+                      TTEntry(-1, EXACT, 0, None)):
+            with self.assertRaises(AssertionError):
+                self.table[(0x1, 0x2)] = entry
+
+
+if __name__ == '__main__':
+    unittest.main()
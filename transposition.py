@@ -0,0 +1,128 @@
+# Purpose: This module implements the transposition table helpers shared by the search agents. A table is a plain dict
+#          keyed by the bitboard pair (own, opp) of a position, which identifies it exactly (including the side to move,
+#          since own always holds the discs of the player to move), so no hashing scheme or collision check is needed.
+#          For searches spread over several processes, SharedTable offers the same get / [] = interface on a fixed-size
+#          table in shared memory, which does need a hash and a check against collisions and torn writes.
+
+from collections import namedtuple
+
+## Bound types stored in a transposition table entry.
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+## A transposition table entry.
+#  depth is the remaining search depth the value was computed with, flag one of EXACT/LOWER/UPPER, and
+#  best_move the square index (x * 8 + y) of the best move found, or None.
+TTEntry = namedtuple('TTEntry', ['depth', 'flag', 'value', 'best_move'])
+
+
+## Look up a position and narrow the search window with the stored bound.
+#  @param tt The transposition table.
+#  @param key The bitboard pair (own, opp) of the position.
+#  @param depth The remaining depth the caller is about to search.
+#  @param alpha The caller's alpha value.
+#  @param beta The caller's beta value.
+#  @return A tuple (value, alpha, beta, best_move); value is not None when the stored entry alone settles the node,
+#          and best_move is the stored best move (a square index) to try first, or None.
+def probe(tt, key, depth, alpha, beta):
+    entry = tt.get(key)
+    if entry is None:
+        return None, alpha, beta, None
+    if entry.depth >= depth:
+        if entry.flag == EXACT:
+            return entry.value, alpha, beta, entry.best_move
+        if entry.flag == LOWER:
+            alpha = max(alpha, entry.value)
+        else:
+            beta = min(beta, entry.value)
+        if alpha >= beta:
+            return entry.value, alpha, beta, entry.best_move
+    return None, alpha, beta, entry.best_move
+
+
+## Store a search result, classifying it against the window it was searched with.
+#  @param tt The transposition table.
+#  @param key The bitboard pair (own, opp) of the position.
+#  @param depth The remaining depth the value was computed with.
+#  @param value The value returned by the search.
+#  @param alpha_orig The alpha value the node was searched with (after probe narrowed it).
+#  @param beta The beta value the node was searched with (after probe narrowed it).
+#  @param best_move The square index of the best move found, or None.
+def store(tt, key, depth, value, alpha_orig, beta, best_move):
+    if value <= alpha_orig:
+        flag = UPPER
+    elif value >= beta:
+        flag = LOWER
+    else:
+        flag = EXACT
+    tt[key] = TTEntry(depth, flag, value, best_move)
+
+
+## Number of index bits of a SharedTable; the table has 2 ** TABLE_BITS entries of 16 bytes.
+TABLE_BITS = 20
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+_VALID = 1 << 63
+_NO_MOVE = 64
+_VALUE_OFFSET = 1 << 15
+
+
+## SharedTable class
+#  A transposition table in shared memory that several processes read and write at once, without locks. Each entry is
+#  two 64-bit words: the packed TTEntry, and the position's hash XORed with it. A read only accepts an entry whose two
+#  words XOR back to the hash of the position looked up, which rejects both entries of other positions sharing the
+#  slot and entries half-overwritten by another process. New entries always replace the old ones.
+class SharedTable:
+
+    ## Create a table, or attach to the table created by another process.
+    #  @param name The name of the shared memory block to attach to, or None to create a new (zeroed) one.
+    def __init__(self, name=None):
+        # Imported here, since multiprocessing.shared_memory only exists from Python 3.8 and only Lazy SMP needs it:
+        from multiprocessing import shared_memory
+        size = 16 << TABLE_BITS
+        if name is None:
+            self._memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._memory = shared_memory.SharedMemory(name=name)
+        self.name = self._memory.name
+        self._words = self._memory.buf.cast('Q')
+        self._index_mask = (1 << TABLE_BITS) - 1
+
+    ## Look up a position.
+    #  @param key The bitboard pair (own, opp) of the position.
+    #  @return The stored TTEntry, or None.
+    def get(self, key):
+        hashed = hash(key) & _MASK64
+        index = (hashed & self._index_mask) << 1
+        words = self._words
+        data = words[index + 1]
+        if words[index] ^ data != hashed or not data & _VALID:
+            return None
+        move = data >> 26 & 0x7F
+        return TTEntry(data & 0xFF, data >> 8 & 0x3, (data >> 10 & 0xFFFF) - _VALUE_OFFSET,
+                       None if move == _NO_MOVE else move)
+
+    ## Store an entry for a position, replacing whatever the slot held.
+    #  @param key The bitboard pair (own, opp) of the position.
+    #  @param entry The TTEntry to store; the packed word holds depths 0 to 255 and values -32768 to 32767.
+    def __setitem__(self, key, entry):
+        hashed = hash(key) & _MASK64
+        index = (hashed & self._index_mask) << 1
+        move = _NO_MOVE if entry.best_move is None else entry.best_move
+        assert 0 <= entry.depth <= 0xFF, entry.depth
+        assert -_VALUE_OFFSET <= entry.value < _VALUE_OFFSET, entry.value
+        assert 0 <= move <= _NO_MOVE, move
+        data = (_VALID | move << 26 | (entry.value + _VALUE_OFFSET) << 10 | entry.flag << 8 | entry.depth)
+        words = self._words
+        words[index + 1] = data
+        words[index] = hashed ^ data
+
+    ## Detach this process from the table.
+    def close(self):
+        self._words.release()
+        self._memory.close()
+
+    ## Free the shared memory block; called once, by the process that created it, after every process closed it.
+    def unlink(self):
+        self._memory.unlink()